@@ -4,40 +4,57 @@ Google Analytics 4 Android Version Distribution Fetcher
 Pulls active users by Android version for Android devices in the last 30 days
 """
 
+import argparse
 import csv
+import functools
+import heapq
+import json
 import os
-from datetime import datetime
-from google.analytics.data_v1beta import BetaAnalyticsDataClient
-from google.analytics.data_v1beta.types import (
-    DateRange,
-    Dimension,
-    Metric,
-    RunReportRequest,
-    FilterExpression,
-    Filter,
-)
-from google.oauth2 import service_account
-from google.auth import default
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from operator import attrgetter, itemgetter
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Tuple
 
 # Configuration
 USE_SERVICE_ACCOUNT = False  # Set to True to use service account, False to use personal account
 SERVICE_ACCOUNT_FILE = "../send-push-notificatation/cmd/service-account.json"
 PROPERTY_ID = "1234567890"  # GA4 Property ID
 OUTPUT_CSV = "android_versions_report.csv"
+WRITE_BUFFER_SIZE = 1 << 20  # 1 MiB file buffer for the CSV output
+CACHE_DIR = Path.home() / ".cache" / "android_versions"  # Cached GA4 results (skip with --no-cache)
+CACHE_MAX_AGE = 24 * 60 * 60  # Reuse cached results for up to 24 hours
 
-def fetch_android_versions(property_id: str, credentials_path: str = None, use_service_account: bool = False):
+class AndroidRow(NamedTuple):
+    """A single report row: one OS version / device category combination"""
+    os_version: str
+    operating_system: str
+    device_category: str
+    active_users: int
+    new_users: Optional[int] = None  # Only fetched when verbose=True
+    sessions: Optional[int] = None  # Only fetched when verbose=True
+
+def _get_client(credentials_path: str = None, use_service_account: bool = False):
     """
-    Fetch active users by Android version for Android devices from Google Analytics 4
-    
-    Args:
-        property_id: GA4 Property ID (numeric)
-        credentials_path: Path to service account JSON file (only needed if use_service_account=True)
-        use_service_account: If True, use service account. If False, use personal account (ADC)
+    Return a GA4 Data API client using a service account or personal account (ADC)
     
-    Returns:
-        List of dictionaries containing the report data
+    The script itself fetches once per run; the cache is for code importing this
+    module and calling fetch_android_versions repeatedly (e.g. for several
+    properties), which then reuses one connection and OAuth token.
     """
-    # Initialize credentials
+    # Always call the cached factory positionally: lru_cache keys positional and
+    # keyword calls separately, which would otherwise build duplicate clients
+    return _cached_client(credentials_path, use_service_account)
+
+@functools.lru_cache(maxsize=2)
+def _cached_client(credentials_path: Optional[str], use_service_account: bool):
+    """Create a GA4 Data API client (cached per credentials settings)"""
+    # Imported lazily: the Google client libraries are slow to import
+    from google.analytics.data_v1beta import BetaAnalyticsDataClient
+    from google.auth import default
+    from google.oauth2 import service_account
+    
     if use_service_account:
         print(f"🔑 Using service account: {credentials_path}")
         credentials = service_account.Credentials.from_service_account_file(
@@ -48,8 +65,18 @@ def fetch_android_versions(property_id: str, credentials_path: str = None, use_s
         print("🔑 Using personal account (Application Default Credentials)")
         credentials, project = default(scopes=["https://www.googleapis.com/auth/analytics.readonly"])
     
-    # Initialize the client
-    client = BetaAnalyticsDataClient(credentials=credentials)
+    return BetaAnalyticsDataClient(credentials=credentials)
+
+def _run_android_report(client, property_id: str, verbose: bool = False) -> List[AndroidRow]:
+    """Run the Android version report for a single property and parse its rows"""
+    from google.analytics.data_v1beta.types import (
+        DateRange,
+        Dimension,
+        Metric,
+        RunReportRequest,
+        FilterExpression,
+        Filter,
+    )
     
     # Build filter for Android devices
     android_filter = FilterExpression(
@@ -70,11 +97,11 @@ def fetch_android_versions(property_id: str, credentials_path: str = None, use_s
             Dimension(name="operatingSystem"),
             Dimension(name="deviceCategory"),
         ],
-        metrics=[
-            Metric(name="activeUsers"),
-            Metric(name="newUsers"),
-            Metric(name="sessions"),
-        ],
+        # New users and sessions are only shown in the verbose summary, so
+        # don't request them otherwise
+        metrics=[Metric(name="activeUsers")] + (
+            [Metric(name="newUsers"), Metric(name="sessions")] if verbose else []
+        ),
         date_ranges=[DateRange(start_date="30daysAgo", end_date="today")],
         dimension_filter=android_filter,
     )
@@ -83,96 +110,168 @@ def fetch_android_versions(property_id: str, credentials_path: str = None, use_s
     print(f"Fetching Android version data from GA4 Property: {property_id}")
     response = client.run_report(request)
     
-    # Parse the response
-    results = []
-    for row in response.rows:
-        os_version = row.dimension_values[0].value
-        operating_system = row.dimension_values[1].value
-        device_category = row.dimension_values[2].value
-        active_users = row.metric_values[0].value
-        new_users = row.metric_values[1].value
-        sessions = row.metric_values[2].value
-        
-        results.append({
-            'os_version': os_version,
-            'operating_system': operating_system,
-            'device_category': device_category,
-            'active_users': active_users,
-            'new_users': new_users,
-            'sessions': sessions
-        })
+    # Parse the response (metrics are converted to int once, here) into a
+    # pre-sized list. Not sized by row_count: that counts every row of the result
+    # set, which can exceed the rows actually returned in this response
+    rows = response.rows
+    results = [None] * len(rows)
+    for i, row in enumerate(rows):
+        dimensions = row.dimension_values
+        metrics = row.metric_values
+        results[i] = AndroidRow(
+            os_version=dimensions[0].value,
+            operating_system=dimensions[1].value,
+            device_category=dimensions[2].value,
+            active_users=int(metrics[0].value),
+            new_users=int(metrics[1].value) if verbose else None,
+            sessions=int(metrics[2].value) if verbose else None,
+        )
+    
+    return results
+
+def fetch_android_versions(property_id: str, credentials_path: str = None, use_service_account: bool = False, verbose: bool = False):
+    """
+    Fetch active users by Android version for Android devices from Google Analytics 4
+    
+    Args:
+        property_id: GA4 Property ID (numeric)
+        credentials_path: Path to service account JSON file (only needed if use_service_account=True)
+        use_service_account: If True, use service account. If False, use personal account (ADC)
+        verbose: If True, also fetch new users and sessions (otherwise left as None)
+    
+    Returns:
+        List of AndroidRow tuples sorted by active users (descending)
+    """
+    client = _get_client(credentials_path, use_service_account)
+    results = _run_android_report(client, property_id, verbose)
     
     # Sort by active users (descending)
-    results.sort(key=lambda x: int(x['active_users']), reverse=True)
+    results.sort(key=lambda r: r.active_users, reverse=True)
     
     return results
 
-def save_to_csv(data: list, output_file: str, property_id: str):
+def _date_range() -> str:
+    """Return the last 30 days as a "YYYYMMDD-YYYYMMDD" string"""
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=30)
+    return f"{start_date.strftime('%Y%m%d')}-{end_date.strftime('%Y%m%d')}"
+
+def _load_cached_results(cache_file: Path) -> Optional[Tuple[List[AndroidRow], str]]:
+    """
+    Return cached report rows and the date range they were fetched for,
+    or None if the cache is missing, stale or unreadable
+    """
+    try:
+        if time.time() - cache_file.stat().st_mtime >= CACHE_MAX_AGE:
+            return None
+        cached = json.loads(cache_file.read_text())
+        return [AndroidRow(*row) for row in cached['rows']], str(cached['date_range'])
+    except Exception:
+        # Any failure (missing, truncated or corrupted file) is just a cache miss
+        return None
+
+def _save_cached_results(cache_file: Path, data: List[AndroidRow], date_range: str):
+    """Store report rows in the cache; failures only cost the next run a refetch"""
+    # Write to a sibling temp file and swap it in, so a crash never leaves a truncated cache
+    tmp_file = cache_file.with_suffix('.json.tmp')
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file.write_text(json.dumps({'date_range': date_range, 'rows': [list(row) for row in data]}))
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        tmp_file.unlink(missing_ok=True)
+        print(f"⚠️  Warning: Could not write cache file {cache_file}: {e}")
+
+def save_to_csv(data: List[AndroidRow], output_file: str, property_id: str, date_range: str = None):
     """
     Save the report data to a CSV file in simplified format
     
     Args:
-        data: List of dictionaries with report data
+        data: List of AndroidRow tuples with report data
         output_file: Output CSV file path
         property_id: GA4 Property ID for header
+        date_range: "YYYYMMDD-YYYYMMDD" period the data covers (defaults to the last 30 days)
     """
     if not data:
         print("No data to save!")
         return
     
     # Calculate grand total
-    grand_total = sum(int(row['active_users']) for row in data)
+    grand_total = sum(map(attrgetter('active_users'), data))
     
     # Get date range for header
-    from datetime import datetime, timedelta
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=30)
-    date_range = f"{start_date.strftime('%Y%m%d')}-{end_date.strftime('%Y%m%d')}"
+    if date_range is None:
+        date_range = _date_range()
     
     # Write to CSV with header
-    with open(output_file, 'w', newline='') as csvfile:
-        # Write header comments
-        csvfile.write("# ----------------------------------------\n")
-        csvfile.write(f"# Property ID: {property_id}\n")
-        csvfile.write("# Active OS Versions - Android Devices\n")
-        csvfile.write(f"# {date_range}\n")
-        csvfile.write("# ----------------------------------------\n")
-        csvfile.write("\n")
-        
-        # Write CSV header
-        writer = csv.writer(csvfile)
-        writer.writerow(['OS version', 'Active users'])
-        
-        # Write grand total
-        writer.writerow(['', grand_total, 'Grand total'])
-        
-        # Write data rows (only version and active users)
-        for row in data:
-            writer.writerow([row['os_version'], row['active_users']])
+    with open(output_file, 'w', newline='', buffering=WRITE_BUFFER_SIZE) as csvfile:
+        # Write header comments as a single block
+        csvfile.write(
+            "# ----------------------------------------\n"
+            f"# Property ID: {property_id}\n"
+            "# Active OS Versions - Android Devices\n"
+            f"# {date_range}\n"
+            "# ----------------------------------------\n"
+            "\n"
+        )
         
-        # Write empty lines at the end
-        writer.writerow([])
-        writer.writerow([])
+        # Write CSV header, grand total, data rows (only version and active users)
+        # and the trailing empty lines in a single batch
+        writer = csv.writer(csvfile, quoting=csv.QUOTE_MINIMAL)
+        writer.writerows([
+            ['OS version', 'Active users'],
+            ['', grand_total, 'Grand total'],
+            *([row.os_version, row.active_users] for row in data),
+            [],
+            [],
+        ])
     
     print(f"✅ Data saved to {output_file}")
     print(f"   Total rows: {len(data)}")
     print(f"   Grand total: {grand_total:,} active users")
 
-def print_summary(data: list):
-    """Print a summary of the data"""
+def _major_key(os_name: str, os_version: str) -> str:
+    """Return the major version group for a row (e.g. "Android 14.x" for "14.0")"""
+    if not os_version or os_version == "(not set)":
+        return f"{os_name} (unknown)"
+    # Extract major version (e.g., "14" from "14.0") without allocating a list
+    major, _, _ = os_version.partition('.')
+    return f"{os_name} {major}.x" if major.isdigit() else f"{os_name} {os_version}"
+
+# Pre-bound row formatters for the summary tables
+_VERSION_ROW = "{:<20} {:<15} {:<15,} {:>6.2f}%".format
+_MAJOR_ROW = "{:<30} {:<15,} {:>6.2f}%".format
+
+def print_summary(data: List[AndroidRow]):
+    """Print a summary of the data (new users and sessions only if they were fetched)"""
     if not data:
         return
     
-    # Calculate totals
-    total_active_users = sum(int(row['active_users']) for row in data)
-    total_new_users = sum(int(row['new_users']) for row in data)
-    total_sessions = sum(int(row['sessions']) for row in data)
+    # New users and sessions are only present when fetched with verbose=True
+    verbose = data[0].new_users is not None
+    
+    # Calculate totals and group by major version (Android 14.x, 13.x, etc.) in one pass
+    total_active_users = 0
+    total_new_users = 0
+    total_sessions = 0
+    major_versions = defaultdict(int)
+    for row in data:
+        active_users = row.active_users
+        total_active_users += active_users
+        if verbose:
+            total_new_users += row.new_users
+            total_sessions += row.sessions
+        major_versions[_major_key(row.operating_system, row.os_version)] += active_users
+    
+    # Scale factor turning user counts into % share (computed once, not per row)
+    percent_scale = 100.0 / total_active_users if total_active_users > 0 else 0.0
     
     print("\n📊 Summary (Last 30 Days - Android Devices Only):")
     print("=" * 70)
     print(f"Total Active Users: {total_active_users:,}")
-    print(f"Total New Users:    {total_new_users:,}")
-    print(f"Total Sessions:     {total_sessions:,}")
+    if verbose:
+        print(f"Total New Users:    {total_new_users:,}")
+        print(f"Total Sessions:     {total_sessions:,}")
     print("=" * 70)
     
     # Show top 10 Android versions
@@ -181,50 +280,31 @@ def print_summary(data: list):
     print(f"{'OS Version':<20} {'OS':<15} {'Active Users':<15} {'% Share':<10}")
     print("-" * 70)
     
-    for i, row in enumerate(data[:10], 1):
-        active_users = int(row['active_users'])
-        percentage = (active_users / total_active_users * 100) if total_active_users > 0 else 0
-        print(f"{row['os_version']:<20} {row['operating_system']:<15} {active_users:<15,} {percentage:>6.2f}%")
+    for row in data[:10]:
+        print(_VERSION_ROW(row.os_version, row.operating_system, row.active_users, row.active_users * percent_scale))
     
     print("-" * 70)
     
-    # Group by major version (Android 14.x, 13.x, etc.)
-    major_versions = {}
-    for row in data:
-        os_name = row['operating_system']
-        os_version = row['os_version']
-        
-        # Extract major version (e.g., "14" from "14.0")
-        if os_version and os_version != "(not set)":
-            major = os_version.split('.')[0]
-            # Handle special case where version might be just a number
-            if major.isdigit():
-                key = f"{os_name} {major}.x"
-            else:
-                key = f"{os_name} {os_version}"
-        else:
-            key = f"{os_name} (unknown)"
-        
-        if key not in major_versions:
-            major_versions[key] = 0
-        major_versions[key] += int(row['active_users'])
-    
-    # Sort by users
-    sorted_major = sorted(major_versions.items(), key=lambda x: x[1], reverse=True)
+    # Pick the top 10 groups by users (no need to sort all of them)
+    top_major = heapq.nlargest(10, major_versions.items(), key=itemgetter(1))
     
     print("\n📈 Distribution by Major Version:")
     print("-" * 70)
     print(f"{'Version':<30} {'Active Users':<15} {'% Share':<10}")
     print("-" * 70)
     
-    for version, users in sorted_major[:10]:
-        percentage = (users / total_active_users * 100) if total_active_users > 0 else 0
-        print(f"{version:<30} {users:<15,} {percentage:>6.2f}%")
+    for version, users in top_major:
+        print(_MAJOR_ROW(version, users, users * percent_scale))
     
     print("-" * 70)
 
 def main():
     """Main execution function"""
+    parser = argparse.ArgumentParser(description="Fetch Android version distribution from Google Analytics 4")
+    parser.add_argument("--no-cache", action="store_true", help="ignore cached results and fetch fresh data from GA4")
+    parser.add_argument("--verbose", action="store_true", help="also fetch and summarize new users and sessions")
+    args = parser.parse_args()
+    
     print("=" * 70)
     print("Google Analytics 4 - Android Version Distribution Report")
     print("Platform: Android | Period: Last 30 Days")
@@ -249,8 +329,18 @@ def main():
         return
     
     try:
-        # Fetch data
-        data = fetch_android_versions(PROPERTY_ID, SERVICE_ACCOUNT_FILE, USE_SERVICE_ACCOUNT)
+        # Fetch data, reusing results cached within the last 24 hours. The cache is
+        # keyed by property only; the file's age decides whether it is still fresh
+        cache_file = CACHE_DIR / f"{PROPERTY_ID}{'_verbose' if args.verbose else ''}.json"
+        cached = None if args.no_cache else _load_cached_results(cache_file)
+        if cached is not None:
+            data, date_range = cached
+            print(f"📦 Using cached data from {cache_file} ({date_range})")
+        else:
+            date_range = _date_range()
+            data = fetch_android_versions(PROPERTY_ID, SERVICE_ACCOUNT_FILE, USE_SERVICE_ACCOUNT, args.verbose)
+            if data:
+                _save_cached_results(cache_file, data, date_range)
         
         if not data:
             print("⚠️  No data found for Android devices in the last 30 days.")
@@ -261,7 +351,7 @@ def main():
             return
         
         # Save to CSV
-        save_to_csv(data, OUTPUT_CSV, PROPERTY_ID)
+        save_to_csv(data, OUTPUT_CSV, PROPERTY_ID, date_range)
         
         # Print summary
         print_summary(data)
@@ -3,9 +3,18 @@
 Updates the embedded CSV data in index.html with the latest android_versions_report.csv
 """
 
-import re
+import mmap
+import os
+import shutil
 from pathlib import Path
 
+# Tags enclosing the embedded CSV data section in index.html
+CSV_OPEN_TAG = b'<script type="text/plain" id="csvData">'
+CSV_CLOSE_TAG = b'</script>'
+
+# 1 MiB write buffer (the 8 KiB default is far too small for large pages)
+WRITE_BUFFER_SIZE = 1 << 20
+
 def update_html_with_csv():
     """Update the embedded CSV data in index.html"""
     
@@ -18,37 +27,53 @@ def update_html_with_csv():
         print(f"❌ CSV file not found: {csv_file}")
         return False
     
-    csv_content = csv_file.read_text()
-    
-    # Remove Property ID line for security (keep only in source CSV)
-    csv_lines = csv_content.split('\n')
-    filtered_lines = [line for line in csv_lines if not line.strip().startswith('# Property ID:')]
-    csv_content = '\n'.join(filtered_lines)
+    # Remove Property ID line for security (keep only in source CSV) while reading
+    with csv_file.open('r') as f:
+        csv_content = ''.join(line for line in f if not line.lstrip().startswith('# Property ID:'))
     
     # Read HTML file
     if not html_file.exists():
         print(f"❌ HTML file not found: {html_file}")
         return False
     
-    html_content = html_file.read_text()
-    
-    # Pattern to match the embedded CSV data section
-    # Match the opening tag, any whitespace/content, and the closing tag
-    pattern = r'(<script type="text/plain" id="csvData">\s*)(.*?)(\s*</script>)'
-    
-    # Replace the CSV data
-    def replace_csv(match):
-        return f'<script type="text/plain" id="csvData">\n{csv_content.strip()}\n</script>'
-    
-    updated_html = re.sub(pattern, replace_csv, html_content, flags=re.DOTALL, count=1)
-    
-    # Check if replacement was successful
-    if updated_html == html_content:
+    # Map the HTML file instead of reading it into memory (mmap can't map an empty file)
+    if html_file.stat().st_size == 0:
         print("⚠️  Warning: CSV data section not found in HTML file")
         return False
     
-    # Write updated HTML
-    html_file.write_text(updated_html)
+    csv_data = csv_content.strip().encode('utf-8')
+    tmp_file = html_file.with_suffix('.html.tmp')
+    
+    with open(html_file, 'rb') as html, mmap.mmap(html.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        # Locate the embedded CSV data section between the opening and closing tags
+        start = mm.find(CSV_OPEN_TAG)
+        end = mm.find(CSV_CLOSE_TAG, start + len(CSV_OPEN_TAG)) if start != -1 else -1
+        if start == -1 or end == -1:
+            print("⚠️  Warning: CSV data section not found in HTML file")
+            return False
+        
+        # Write the updated HTML (unchanged prefix, new CSV data, unchanged suffix)
+        # to a sibling temp file
+        try:
+            with open(tmp_file, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+                f.write(mm[:start + len(CSV_OPEN_TAG)])
+                f.write(b'\n' + csv_data + b'\n')
+                f.write(mm[end:])
+                # Make sure the data is on disk before the swap, so a power loss can't
+                # leave index.html pointing at an empty or partial file
+                f.flush()
+                os.fsync(f.fileno())
+        except BaseException:
+            tmp_file.unlink(missing_ok=True)
+            raise
+    
+    # Atomically swap the temp file in, keeping the original file mode
+    try:
+        shutil.copymode(html_file, tmp_file)
+        os.replace(tmp_file, html_file)
+    except BaseException:
+        tmp_file.unlink(missing_ok=True)
+        raise
     print(f"✓ Updated embedded CSV data in {html_file.name}")
     return True
 